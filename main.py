@@ -1,13 +1,17 @@
 # main.py
+import json
 import logging
 import os
 from fastapi import FastAPI, HTTPException, Path
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 from typing import Dict, Any, Optional, List
 
+import orjson
+
 # Import refactored components
-from src.task import Task, TaskType
+from src.task import Task, TaskType, parse_task_type
 from src.scheduler import Scheduler
 from src.llm_service import LLMService
 
@@ -31,10 +35,22 @@ llm_service = LLMService(api_key=api_key)
 scheduler = Scheduler(llm_service=llm_service, max_concurrent_tasks=20)
 
 # --- FastAPI Application Setup ---
+class FallbackORJSONResponse(ORJSONResponse):
+    """Encodes with orjson, falling back to the stdlib encoder for values orjson rejects."""
+
+    def render(self, content: Any) -> bytes:
+        try:
+            return super().render(content)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits in a client-submitted payload.
+            return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
 app = FastAPI(
     title="LLM Agent Scheduler",
     description="An OS-inspired asynchronous scheduler for LLM agents with true concurrency.",
-    version="1.0.0"
+    version="1.0.0",
+    # Serialize responses with orjson (already a dependency) instead of the stdlib json module.
+    default_response_class=FallbackORJSONResponse
 )
 
 app.add_middleware(
@@ -81,9 +97,8 @@ async def root():
 @app.post("/tasks", response_model=TaskResponse, status_code=202)
 async def submit_task(task_request: CreateTaskRequest):
     """Submits a new task to the scheduler."""
-    try:
-        task_type_enum = TaskType(task_request.task_type.lower())
-    except ValueError:
+    task_type_enum = parse_task_type(task_request.task_type)
+    if task_type_enum is None:
         raise HTTPException(status_code=400, detail=f"Invalid task type: '{task_request.task_type}'. Valid types are: {[t.value for t in TaskType]}")
 
     try:
@@ -107,6 +122,7 @@ async def get_task_status(task_id: str = Path(..., description="The ID of the ta
     task = await scheduler.get_task_by_id(task_id)
     if not task:
         raise HTTPException(status_code=404, detail=f"Task with ID '{task_id}' not found.")
+    # The payload can hold the agent's message objects, so let FastAPI's encoder convert them.
     return task.to_dict()
 
 @app.get("/stats", response_model=Dict[str, Any])
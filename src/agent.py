@@ -1,7 +1,9 @@
 # src/agent.py
 import json
 import logging
-from typing import Dict, Any, AsyncGenerator, List, Optional
+from typing import Dict, Any, AsyncGenerator, List, Optional, Sequence
+
+import orjson
 
 from .task import Task
 from .llm_service import LLMService
@@ -13,6 +15,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger("Agent")
 
+PLAN_PARSING_SYSTEM_PROMPT = """
+You convert a task plan written by another model into JSON. Do not change the plan, only its format.
+
+Return a JSON object with a single key "subtasks", whose value is a list of subtask objects with the keys:
+- "name": the subtask's name.
+- "task_type": one of 'planning', 'function_call', 'information_retrieval'.
+- "payload": a dictionary; for 'function_call' it contains 'tool_name' and 'parameters', otherwise a 'prompt'.
+- "dependencies": a list of names of subtasks that must finish first (empty list if none).
+"""
+
 class Agent:
     """
     The Agent is responsible for executing a single task by interacting with the LLM.
@@ -83,8 +95,16 @@ class Agent:
 
         while True:
             response_message = None
+            # The message history grows every turn; only serialize it when it will actually be logged.
+            # This stays outside the try below, so that enabling DEBUG logging can never fail the task.
+            if logger.isEnabledFor(logging.DEBUG):
+                try:
+                    messages_dump = orjson.dumps(messages, default=message_serializer, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+                except orjson.JSONEncodeError:
+                    # e.g. integers beyond 64 bits, which the stdlib encoder accepts.
+                    messages_dump = json.dumps(messages, default=message_serializer, indent=2, skipkeys=True)
+                logger.debug("Task %s: Sending request to LLM with %d messages.\nMessages: %s", task.id, len(messages), messages_dump)
             try:
-                logger.debug(f"Task {task.id}: Sending request to LLM with {len(messages)} messages.\nMessages: {json.dumps(messages, indent=2, default=message_serializer)}")
                 response = await self.llm_service.client.chat.completions.create(
                     model=model,
                     messages=messages,
@@ -92,7 +112,8 @@ class Agent:
                     tool_choice="auto" if tools else None,
                 )
                 response_message = response.choices[0].message
-                logger.debug(f"Task {task.id}: Received response from LLM.\nResponse: {response_message}")
+                # Lazy %-formatting: the response's repr is only built when DEBUG is enabled.
+                logger.debug("Task %s: Received response from LLM.\nResponse: %s", task.id, response_message)
 
             except Exception as e:
                 logger.error(f"Task {task.id} failed during LLM API call: {e}", exc_info=True)
@@ -133,13 +154,29 @@ class PlannerAgent:
     The PlannerAgent is responsible for decomposing a complex task into a structured plan
     of subtasks. It interacts with the LLM to generate this plan.
     """
-    def __init__(self, llm_service: LLMService):
+    def __init__(self, llm_service: LLMService, parsing_model: Optional[str] = None):
+        """
+        Initializes the PlannerAgent.
+        :param llm_service: An instance of LLMService to interact with the language model.
+        :param parsing_model: Optional cheaper model used to convert a free-form plan into JSON.
+            When set, the planning model reasons without JSON mode and this model only
+            reformats its answer; when None, a single JSON-mode call is made.
+        """
         self.llm_service = llm_service
+        self.parsing_model = parsing_model
+        # The system prompt depends only on the tool list, which is normally the same
+        # object on every call; remember the last one built and the tools it was built for.
+        self._system_prompt_tools: Optional[Sequence[Dict[str, Any]]] = None
+        self._system_prompt: Optional[str] = None
 
     async def decompose_task(self, task: "Task", tools: list = None) -> dict:
         logger.info(f"PlannerAgent: Decomposing task {task.id} ('{task.name}')")
         user_prompt = task.payload.get("prompt")
-        system_prompt = self._get_planning_system_prompt(tools)
+        if self._system_prompt is None or tools is not self._system_prompt_tools:
+            # In two-stage mode the planning model writes prose; the JSON schema is the parsing model's job.
+            self._system_prompt = self._get_planning_system_prompt(tools, json_output=not self.parsing_model)
+            self._system_prompt_tools = tools
+        system_prompt = self._system_prompt
 
         logger.debug(f"--- Planner System Prompt for Task {task.id} ---\n{system_prompt}\n--------------------------------------------------")
         logger.debug(f"--- Planner User Prompt for Task {task.id} ---\n{user_prompt}\n--------------------------------------------------")
@@ -149,13 +186,24 @@ class PlannerAgent:
             {"role": "user", "content": user_prompt}
         ]
 
+        plan_json_str = None
         try:
-            response = await self.llm_service.client.chat.completions.create(
-                model=self.llm_service.model,
-                messages=messages,
-                response_format={"type": "json_object"}, # Force JSON output
-            )
-            plan_json_str = response.choices[0].message.content
+            if self.parsing_model:
+                # Let the planning model reason freely, then have the parsing model reformat its answer.
+                response = await self.llm_service.client.chat.completions.create(
+                    model=self.llm_service.model,
+                    messages=messages,
+                )
+                plan_text = response.choices[0].message.content
+                logger.debug(f"Planner received free-form plan for task {task.id}:\n{plan_text}")
+                plan_json_str = await self._parse_plan(plan_text)
+            else:
+                response = await self.llm_service.client.chat.completions.create(
+                    model=self.llm_service.model,
+                    messages=messages,
+                    response_format={"type": "json_object"}, # Force JSON output
+                )
+                plan_json_str = response.choices[0].message.content
             logger.debug(f"Planner received LLM response for task {task.id}:\n{plan_json_str}")
             plan = json.loads(plan_json_str)
             logger.debug(f"Parsed plan for task {task.id}: {plan}")
@@ -168,8 +216,36 @@ class PlannerAgent:
             logger.error(f"PlannerAgent: LLM call failed during planning for task {task.id}. Error: {e}", exc_info=True)
             return None
 
-    def _get_planning_system_prompt(self, tools: list = None) -> str:
-        base_prompt = """
+    async def _parse_plan(self, plan_text: str) -> str:
+        """Uses the parsing model to convert a free-form plan into the plan JSON schema."""
+        response = await self.llm_service.client.chat.completions.create(
+            model=self.parsing_model,
+            messages=[
+                {"role": "system", "content": PLAN_PARSING_SYSTEM_PROMPT},
+                {"role": "user", "content": plan_text}
+            ],
+            response_format={"type": "json_object"}, # Force JSON output
+        )
+        return response.choices[0].message.content
+
+    def _get_planning_system_prompt(self, tools: list = None, json_output: bool = True) -> str:
+        if not json_output:
+            base_prompt = """
+        You are a master planner AI. Your role is to decompose a complex user request into a series of manageable subtasks.
+        Think the request through, then write the plan as a numbered list in plain language.
+
+        For each subtask, state:
+        - A short, descriptive name for it (e.g., "search_for_papers").
+        - Whether it is further planning, a tool call, or information retrieval.
+        - For a tool call, which tool to call and with which parameters; otherwise, the prompt to answer.
+        - Which earlier subtasks, by name, must be completed before it can start, if any.
+
+        Analyze the user's request carefully and create a logical plan. Ensure that dependencies are correctly identified.
+        For a task that requires summarizing multiple previous results, make it dependent on all those preceding tasks.
+        A final task should always be present to synthesize all results into a final answer.
+        """
+        else:
+            base_prompt = """
         You are a master planner AI. Your role is to decompose a complex user request into a series of manageable subtasks.
         You must return the plan as a valid JSON object.
 
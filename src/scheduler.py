@@ -1,14 +1,100 @@
 import asyncio
+import concurrent.futures
+import copy
+import functools
+import hashlib
+import inspect
 import json
 import logging
-from typing import Dict, Any, Optional, AsyncGenerator, List
+import os
+import re
+from collections import Counter, OrderedDict, defaultdict, deque
+from typing import Dict, Any, Optional, AsyncGenerator, Deque, List, Set, Tuple
 
-from .task import Task, TaskStatus, TaskType
+import orjson
+
+from .task import Task, TaskStatus, TaskType, parse_task_type
 from .agent import Agent, PlannerAgent
 from .llm_service import LLMService
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of decomposed plans kept in the scheduler's plan cache.
+_PLAN_CACHE_MAX_ENTRIES = 512
+
+# How long shutdown() lets busy workers finish the step they are driving before cancelling them.
+_SHUTDOWN_GRACE_SECONDS = 30.0
+
+# Planning prompts at most this long, with no multi-step wording, are answered
+# directly instead of being sent to the planner.
+_ATOMIC_PROMPT_MAX_WORDS = 12
+_MULTI_STEP_PATTERN = re.compile(
+    r"\b(then|after|before|first|next|finally|each|every|all|compare|summari[sz]e|report|steps?|search|find|and)\b|[,;:\n]",
+    re.IGNORECASE,
+)
+
+def _dumps_tool_content(value: Any) -> str:
+    """Encodes a tool message body, accepting everything json.dumps does."""
+    try:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+    except orjson.JSONEncodeError:
+        # orjson refuses integers beyond 64 bits, among others; the stdlib encoder is the
+        # reference, and anything it rejects too is reported back to the agent as an error.
+        return json.dumps(value)
+
+class ReadyQueue:
+    """
+    Runnable work for the scheduler. Items are served by priority (lowest key first;
+    any comparable key works) and, within a priority, round-robin across the plans
+    they belong to, so that one large plan cannot hold back every other task of the
+    same priority.
+    """
+
+    def __init__(self):
+        # priority -> plan (parent task ID) -> FIFO of items; empty entries are removed.
+        self._bands: Dict[Any, "OrderedDict[Optional[str], Deque[Any]]"] = {}
+        self._size = 0
+        # One permit per queued item, so each put wakes exactly one waiting getter.
+        self._available = asyncio.Semaphore(0)
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def put_nowait(self, item: Any, priority: Any, group: Optional[str]):
+        groups = self._bands.get(priority)
+        if groups is None:
+            groups = self._bands[priority] = OrderedDict()
+        queue = groups.get(group)
+        if queue is None:
+            queue = groups[group] = deque()
+        queue.append(item)
+        self._size += 1
+        self._available.release()
+
+    def _pop(self) -> Any:
+        """Removes the next item; the caller must already hold its permit."""
+        priority = min(self._bands)
+        groups = self._bands[priority]
+        group, queue = next(iter(groups.items()))
+        item = queue.popleft()
+        if queue:
+            # Rotate this plan to the back so the next item comes from another plan.
+            groups.move_to_end(group)
+        else:
+            del groups[group]
+            if not groups:
+                del self._bands[priority]
+        self._size -= 1
+        return item
+
+    async def get(self) -> Any:
+        await self._available.acquire()
+        return self._pop()
+
+
 class Scheduler:
     """
     An OS-like scheduler that manages the lifecycle of LLM agent tasks.
@@ -16,31 +102,38 @@ class Scheduler:
     and enables true concurrent execution.
     """
 
-    def __init__(self, llm_service: LLMService, tools: List[Dict[str, Any]] = None, max_concurrent_tasks: int = 5):
+    def __init__(self, llm_service: LLMService, tools: List[Dict[str, Any]] = None, max_concurrent_tasks: int = 5, parsing_model: Optional[str] = None):
         self.llm_service = llm_service
         self.agent = Agent(llm_service)
-        self.planner_agent = PlannerAgent(llm_service)
+        self.planner_agent = PlannerAgent(llm_service, parsing_model=parsing_model)
         self.tools = tools if tools is not None else []
         self._tool_functions = {tool['function']['name']: tool['callable'] for tool in self.tools}
+        # Handed to the planner as the same object every time, so it can reuse the system prompt built from it.
+        self._planner_tools = tuple(self.tools)
         self.max_concurrent_tasks = max_concurrent_tasks
-        self.semaphore = asyncio.Semaphore(max_concurrent_tasks)
+        # Workers currently driving a task; concurrency is bounded by the number of workers.
+        self._busy_workers: Set[asyncio.Task] = set()
         
-        self.pending_queue = asyncio.Queue()
-        self.resumption_queue = asyncio.Queue()
+        # New and resumed tasks share one queue of (task, tool_result, generator) items;
+        # tool_result and generator are None unless the task is resuming after a tool call.
+        self._ready_queue = ReadyQueue()
         
         self.tasks: Dict[str, Task] = {}
-        self.task_generators: Dict[str, AsyncGenerator] = {}
+        # Reverse dependency edges: task ID -> IDs of tasks waiting for it to finish.
+        self._dependents: Dict[str, Set[str]] = defaultdict(set)
+        # LRU cache of planner output keyed by a fingerprint of the planning prompt.
+        self._plan_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
         
         self.is_running = False
-        self._main_loop_task: Optional[asyncio.Task] = None
-        self._lock = asyncio.Lock()
+        # Long-lived worker coroutines, one per concurrency slot, that drive tasks off the ready queue.
+        self._workers: List[asyncio.Task] = []
+        # Worker threads for synchronous tool functions, so they don't block the event loop.
+        self._tool_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
 
-        # Statistics
-        self.completed_tasks_count = 0
-        self.failed_tasks_count = 0
-        self.running_tasks_count = 0
-        self.pending_tasks_count = 0
-        self.waiting_tasks_count = 0
+        # Statistics: number of known tasks in each status, kept current via Task.on_status_change.
+        self._status_counts: Counter = Counter()
+        # Parents that completed even though at least one of their subtasks failed.
+        self._completed_with_failed_subtasks = 0
 
     async def shutdown(self):
         """Shuts down the scheduler gracefully."""
@@ -50,50 +143,89 @@ class Scheduler:
         logger.info("Scheduler shutting down...")
         self.is_running = False
         
-        # Cancel the main loop task
-        if self._main_loop_task:
-            self._main_loop_task.cancel()
-            try:
-                await self._main_loop_task
-            except asyncio.CancelledError:
-                logger.info("Main loop task cancelled.")
+        # Idle workers are parked on the ready queue and can be cancelled. Busy ones get a grace
+        # period to finish the step they are driving (with is_running cleared they exit afterwards);
+        # those still busy after it are cancelled, which fails the task they were driving.
+        for worker in self._workers:
+            if worker not in self._busy_workers:
+                worker.cancel()
+        busy_workers = set(self._busy_workers)
+        if busy_workers:
+            logger.info(f"Waiting up to {_SHUTDOWN_GRACE_SECONDS}s for {len(busy_workers)} in-flight tasks to finish their current step.")
+            _, stragglers = await asyncio.wait(busy_workers, timeout=_SHUTDOWN_GRACE_SECONDS)
+            if stragglers:
+                logger.warning(f"Cancelling {len(stragglers)} tasks still running after the shutdown grace period.")
+                for worker in stragglers:
+                    worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Worker tasks stopped.")
         
         # You might want to add logic here to handle any tasks still in queues
         # For now, we'll just log a warning if there are pending tasks.
-        if not self.pending_queue.empty() or not self.resumption_queue.empty():
+        if not self._ready_queue.empty():
             logger.warning("Shutdown initiated with pending tasks still in queues.")
 
+        self._shutdown_tool_executor()
         logger.info("Scheduler shutdown complete.")
 
     async def start(self):
-        """Starts the scheduler's main loop in the background."""
+        """Starts the scheduler's workers in the background."""
         if self.is_running:
             logger.warning("Scheduler is already running.")
             return
         self.is_running = True
-        self._main_loop_task = asyncio.create_task(self._main_loop())
+        if self._tool_executor is None:
+            self._tool_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_concurrent_tasks * 2, thread_name_prefix="scheduler-tool"
+            )
+        self._workers = [asyncio.create_task(self._worker_loop(i)) for i in range(self.max_concurrent_tasks)]
         logger.info("Scheduler started.")
 
     async def stop(self):
-        """Stops the scheduler's main loop gracefully."""
-        self.is_running = False
-        if self._main_loop_task:
-            self._main_loop_task.cancel()
-            try:
-                await self._main_loop_task
-            except asyncio.CancelledError:
-                pass
-        logger.info("Scheduler stopped.")
+        """Stops the scheduler's workers gracefully; an alias for shutdown()."""
+        await self.shutdown()
+
+    def _shutdown_tool_executor(self):
+        """Releases the tool worker threads; tool calls still in flight are allowed to finish."""
+        if self._tool_executor is not None:
+            self._tool_executor.shutdown(wait=False)
+            self._tool_executor = None
 
     async def add_task(self, task: Task):
         """Adds a new task to the scheduler's queue."""
-        async with self._lock:
-            self.tasks[task.id] = task
-            self.pending_tasks_count += 1
-        await self.pending_queue.put(task)
-        logger.info(f"Task {task.id} added to the queue.")
+        self._register_task(task)
+        if not task.dependencies:
+            # The common case: nothing to wait for, so no dependency bookkeeping at all.
+            self._enqueue(task)
+            logger.info(f"Task {task.id} added to the queue.")
+            return task
+
+        for dep_id in task.dependencies:
+            dep_task = self.tasks.get(dep_id)
+            if dep_task is None or dep_task.is_finished():
+                # Unknown or already finished dependencies would never be resolved.
+                task.pending_dependencies -= 1
+            else:
+                self._dependents[dep_id].add(task.id)
+
+        if task.is_ready():
+            self._enqueue(task)
+            logger.info(f"Task {task.id} added to the queue.")
+        else:
+            logger.info(f"Task {task.id} added; waiting for {task.pending_dependencies} dependencies.")
         return task
 
+    def _register_task(self, task: Task):
+        """Records a task as known to the scheduler and starts tracking its status."""
+        self.tasks[task.id] = task
+        self._status_counts[task.status] += 1
+        task.on_status_change = self._on_status_change
+
+    def _on_status_change(self, old_status: TaskStatus, new_status: TaskStatus):
+        self._status_counts[old_status] -= 1
+        self._status_counts[new_status] += 1
+
     def get_task_status(self, task_id: str) -> Optional[str]:
         """Gets the status of a task."""
         task = self.tasks.get(task_id)
@@ -106,58 +238,96 @@ class Scheduler:
             return task.result
         return None
 
-    async def _main_loop(self):
-        """The core loop that sources tasks from pending and resumption queues."""
-        logger.info("Scheduler main loop started.")
+    async def _worker_loop(self, worker_id: int):
+        """Takes runnable tasks from the ready queue and drives them, one at a time."""
+        logger.debug("Scheduler worker %d started.", worker_id)
+        worker = asyncio.current_task()
         while self.is_running:
-            pending_task_future = asyncio.create_task(self.pending_queue.get())
-            resumption_task_future = asyncio.create_task(self.resumption_queue.get())
-
             try:
-                done, pending = await asyncio.wait(
-                    [pending_task_future, resumption_task_future],
-                    return_when=asyncio.FIRST_COMPLETED
-                )
-
-                for future in pending:
-                    future.cancel()
-
-                task_or_tuple = done.pop().result()
-                if isinstance(task_or_tuple, tuple):
-                    task, tool_result = task_or_tuple
-                else:
-                    task = task_or_tuple
-                    tool_result = None
-
-                logger.debug(f"Considering task {task.id} for execution. Available semaphore slots: {self.semaphore._value}")
-                await self.semaphore.acquire()
-                logger.debug(f"Semaphore acquired for task {task.id}. Remaining slots: {self.semaphore._value}")
-                self.running_tasks_count += 1
-                asyncio.create_task(self._drive_task(task, tool_result=tool_result))
+                task, tool_result, generator = await self._ready_queue.get()
+            except asyncio.CancelledError:
+                break
 
+            self._busy_workers.add(worker)
+            logger.debug("Worker %d picked up task %s. Busy workers: %d", worker_id, task.id, len(self._busy_workers))
+            try:
+                await self._drive_task(task, tool_result=tool_result, generator=generator)
             except asyncio.CancelledError:
-                logger.info("Main loop cancelled.")
-                pending_task_future.cancel()
-                resumption_task_future.cancel()
+                # Cancelled mid-step by shutdown(): fail the task rather than leave it RUNNING or
+                # WAITING_FOR_TOOL, so its parent and the status counts stay consistent.
+                if not task.is_finished():
+                    task.fail("Interrupted by scheduler shutdown.")
+                    await self._handle_task_completion(task)
                 break
             except Exception as e:
-                logger.error(f"An error occurred in the main loop: {e}", exc_info=True)
-
-        logger.info("Scheduler main loop stopped.")
-
-    async def _drive_task(self, task: Task, tool_result: Any = None):
+                logger.error(f"An error occurred in scheduler worker {worker_id}: {e}", exc_info=True)
+            finally:
+                self._busy_workers.discard(worker)
+
+        logger.debug("Scheduler worker %d stopped.", worker_id)
+
+    async def _get_plan(self, task: Task) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Returns a plan for a planning task, reusing a cached plan for an identical prompt,
+        together with the cache key to store it under once it validates. The key is None
+        when the plan was not freshly produced by the planner.
+        """
+        prompt = task.payload.get("prompt") or ""
+        # With scheduler tools configured, even a short prompt may need one; only the planner
+        # knows to turn that into a function_call subtask, so never bypass it then.
+        if not self.tools and self._is_atomic(prompt):
+            logger.info(f"Task '{task.name}' ({task.id}) looks atomic; skipping the planner.")
+            return ({"subtasks": [{
+                "name": f"{task.name} (direct)",
+                "task_type": TaskType.INFORMATION_RETRIEVAL.value,
+                # The whole payload, so per-task tools, model and messages still reach the agent.
+                "payload": dict(task.payload),
+                "dependencies": [],
+            }]}, None)
+
+        normalized_prompt = prompt.strip().lower()
+        key = hashlib.blake2b(normalized_prompt.encode(), digest_size=16).hexdigest()
+
+        cached_plan = self._plan_cache.get(key)
+        if cached_plan is not None:
+            self._plan_cache.move_to_end(key)
+            logger.info(f"Plan cache hit for task '{task.name}' ({task.id}).")
+            # Subtask payloads are handed to new tasks, so never share the cached objects.
+            return copy.deepcopy(cached_plan), None
+
+        plan = await self.planner_agent.decompose_task(task, tools=self._planner_tools)
+        return plan, key
+
+    def _remember_plan(self, key: str, plan: Dict[str, Any]):
+        """Caches a plan that has been validated, so identical prompts can skip the planner."""
+        # Subtask payloads are handed to new tasks, so never share them with the cache.
+        self._plan_cache[key] = copy.deepcopy(plan)
+        if len(self._plan_cache) > _PLAN_CACHE_MAX_ENTRIES:
+            self._plan_cache.popitem(last=False)
+
+    @staticmethod
+    def _is_atomic(prompt: str) -> bool:
+        """Cheap check for short, single-step prompts that need no decomposition."""
+        return 0 < len(prompt.split()) <= _ATOMIC_PROMPT_MAX_WORDS and not _MULTI_STEP_PATTERN.search(prompt)
+
+    def _enqueue(self, task: Task, tool_result: Any = None, generator: Optional[AsyncGenerator] = None):
+        """Puts a runnable task on the ready queue, in its priority band and plan."""
+        # Within a priority, tasks resuming after a tool call go ahead of tasks that have not
+        # started: they are closer to finishing and release their generator state sooner.
+        band = (task.priority, 0 if generator is not None else 1)
+        self._ready_queue.put_nowait((task, tool_result, generator), band, task.parent_id)
+
+    async def _drive_task(self, task: Task, tool_result: Any = None, generator: Optional[AsyncGenerator] = None):
         logger.info(f"--- Driving task: '{task.name}' ({task.id}), Type: {task.task_type.value}, Status: {task.status.value} ---")
-        # This wrapper ensures the semaphore is acquired and released correctly.
-        logger.debug(f"Task '{task.name}' ({task.id}) waiting for semaphore. Available: {self.semaphore._value}")
-        await self.semaphore.acquire()
-        logger.debug(f"Task '{task.name}' ({task.id}) acquired semaphore. Available: {self.semaphore._value}")
+        # Runs on one of the scheduler's workers, which stays occupied until this returns,
+        # whether the task finished, failed or paused for a tool call.
         try:
 
             # --- Task Decomposition Step ---
-            if task.task_type == TaskType.PLANNING and task.status == TaskStatus.QUEUED:
+            if task.task_type is TaskType.PLANNING and task.status is TaskStatus.QUEUED:
                 try:
 
-                    plan = await self.planner_agent.decompose_task(task, tools=self.tools)
+                    plan, plan_cache_key = await self._get_plan(task)
                     subtask_defs = plan.get('subtasks', []) if plan else []
 
                     if not subtask_defs:
@@ -165,28 +335,83 @@ class Scheduler:
                         await self._handle_task_completion(task)
                         return
 
-                    all_tasks_by_name = {t.name: t for t in self.tasks.values()}
                     newly_created_subtasks = {}
+                    subtasks = []
+
+                    # Random IDs for the whole plan from a single os.urandom call, 32 hex digits each.
+                    subtask_ids = os.urandom(16 * len(subtask_defs)).hex()
+
+                    # First pass: build every subtask so that siblings can refer to each other by name.
+                    # Nothing is registered with the scheduler until the whole plan has been validated.
+                    for index, sub_def in enumerate(subtask_defs):
+                        raw_type = sub_def['task_type']
+                        task_type = parse_task_type(raw_type)
+                        if task_type is None:
+                            raise ValueError(f"'{raw_type}' is not a valid TaskType")
 
-                    for sub_def in subtask_defs:
-                        dep_ids = [all_tasks_by_name[dep_name].id for dep_name in sub_def.get('dependencies', []) if dep_name in all_tasks_by_name]
-                        
                         subtask = Task(
                             name=sub_def['name'],
                             payload=sub_def['payload'],
-                            task_type=TaskType(sub_def['task_type'].lower()),
+                            task_type=task_type,
                             parent_id=task.id,
-                            dependencies=dep_ids
+                            priority=task.priority,
+                            task_id=subtask_ids[32 * index:32 * index + 32]
                         )
-                        self.tasks[subtask.id] = subtask
-                        task.waiting_for_subtasks.add(subtask.id)
                         newly_created_subtasks[sub_def['name']] = subtask
-
-                    # Enqueue newly created tasks that are ready to run.
-                    for subtask in newly_created_subtasks.values():
+                        subtasks.append((subtask, sub_def.get('dependencies')))
+
+                    # Second pass: resolve dependency names. Names refer to siblings in this plan only:
+                    # dependencies just order work, and binding to a task outside the plan could make
+                    # it wait on something that itself waits for this plan to finish.
+                    links = []
+                    # Edges between subtasks of this plan: subtask ID -> IDs of siblings waiting for it.
+                    plan_dependents: Dict[str, Set[str]] = defaultdict(set)
+                    in_plan_waits: Counter = Counter()
+                    for subtask, dep_names in subtasks:
+                        if not dep_names:
+                            continue
+                        for dep_name in dep_names:
+                            dep_task = newly_created_subtasks.get(dep_name)
+                            if dep_task is None:
+                                logger.warning(f"Subtask '{subtask.name}' of task {task.id} depends on unknown subtask '{dep_name}'; ignoring it.")
+                                continue
+                            if subtask.id not in plan_dependents[dep_task.id]:
+                                links.append((subtask, dep_task))
+                                plan_dependents[dep_task.id].add(subtask.id)
+                                in_plan_waits[subtask.id] += 1
+
+                    # Kahn's algorithm over the plan's edges: every subtask must be reachable from
+                    # one that waits for no sibling, otherwise part of the plan can never start.
+                    frontier = [subtask.id for subtask, _ in subtasks if not in_plan_waits[subtask.id]]
+                    reachable = 0
+                    while frontier:
+                        subtask_id = frontier.pop()
+                        reachable += 1
+                        for dependent_id in plan_dependents.get(subtask_id, ()):
+                            in_plan_waits[dependent_id] -= 1
+                            if not in_plan_waits[dependent_id]:
+                                frontier.append(dependent_id)
+                    if reachable < len(subtasks):
+                        raise ValueError("Plan dependencies form a cycle; some subtasks could never start.")
+
+                    # Only a plan that built and validated is worth reusing; a bad planner answer
+                    # is retried on the next identical prompt instead of being served from the cache.
+                    if plan_cache_key is not None:
+                        self._remember_plan(plan_cache_key, plan)
+
+                    # The plan is valid: register the subtasks, link them and start the ready ones.
+                    for subtask, _ in subtasks:
+                        self._register_task(subtask)
+                    for subtask, dep_task in links:
+                        subtask.add_dependency(dep_task.id)
+                        self._dependents[dep_task.id].add(subtask.id)
+
+                    task.remaining_subtasks = len(subtasks)
+
+                    for subtask, _ in subtasks:
                         if subtask.is_ready():
-                            await self.pending_queue.put(subtask)
-                            logger.info(f"Enqueued new subtask '{subtask.name}' for parent {task.id}")
+                            self._enqueue(subtask)
+                            logger.info(f"Dispatched new subtask '{subtask.name}' for parent {task.id}")
 
                     task.update_status(TaskStatus.WAITING_FOR_SUBTASKS)
                     logger.info(f"Task '{task.name}' ({task.id}) status is now WAITING_FOR_SUBTASKS.")
@@ -195,142 +420,147 @@ class Scheduler:
                     logger.error(f"Failed to decompose task {task.id}: {e}", exc_info=True)
                     task.fail(f"Decomposition failed: {e}")
                     await self._handle_task_completion(task)
-                finally:
-                    # Release semaphore here for planning tasks, so subtasks can run.
-                    logger.debug(f"Planning task '{task.name}' ({task.id}) releasing semaphore early.")
-                    self.semaphore.release()
-                    return
 
             # --- Standard Task Driving Step ---
             else:
-                if task.id not in self.task_generators:
+                if generator is None:
                     # This is the first time we're driving this task.
                     logger.info(f"Creating new generator for task '{task.name}' ({task.id}).")
                     generator = self.agent.process_task(task)
-                    self.task_generators[task.id] = generator
                     send_value = None  # Start the generator for the first time
                 else:
                     # Resuming a task that was waiting for a tool call.
                     logger.info(f"Resuming task '{task.name}' ({task.id}) with tool result.")
-                    generator = self.task_generators[task.id]
                     send_value = tool_result
 
                 task.update_status(TaskStatus.RUNNING)
 
                 try:
-                    logger.debug(f"Awaiting asend() for task {task.id}...")
+                    logger.debug("Awaiting asend() for task %s...", task.id)
                     tool_request = await generator.asend(send_value)
-                    logger.debug(f"asend() completed for task {task.id}.")
+                    logger.debug("asend() completed for task %s.", task.id)
 
                     if tool_request:
                         task.update_status(TaskStatus.WAITING_FOR_TOOL)
                         logger.info(f"Task '{task.name}' ({task.id}) is waiting for tool call.")
-                        await self._execute_and_resume_task(task, tool_request)
+                        try:
+                            await self._execute_and_resume_task(task, tool_request, generator)
+                        except asyncio.CancelledError:
+                            # Interrupted while the agent is paused at its tool request: close it.
+                            await generator.aclose()
+                            raise
                     else:
-                        # Generator finished, task is complete.
-                        task.complete(task.result)
+                        # Generator finished. The agent has normally completed or failed the task already.
+                        if not task.is_finished():
+                            task.complete(task.result)
                         await self._handle_task_completion(task)
 
                 except StopAsyncIteration:
                     # Generator finished, task is complete.
                     logger.info(f"Task '{task.name}' ({task.id}) execution generator finished.")
-                    task.complete(task.result)
+                    # The agent has normally completed or failed the task already; don't overwrite a failure.
+                    if not task.is_finished():
+                        task.complete(task.result)
                     await self._handle_task_completion(task)
                 except Exception as e:
                     logger.error(f"An error occurred while driving task {task.id}: {e}", exc_info=True)
                     task.fail(str(e))
                     await self._handle_task_completion(task)
-                finally:
-                    # Release the semaphore if the task is fully finished or failed
-                    if task.status in [TaskStatus.COMPLETED, TaskStatus.FAILED]:
-                        self.semaphore.release()
-                        logger.debug(f"Task '{task.name}' ({task.id}) released semaphore upon completion/failure.")
 
         except Exception as e:
             logger.error(f"Critical error in _drive_task for {task.id} ({task.name}): {e}", exc_info=True)
             task.fail(f"Scheduler-level error: {e}")
             await self._handle_task_completion(task)
-        finally:
-            logger.debug(f"Task '{task.name}' ({task.id}) releasing semaphore. Available: {self.semaphore._value + 1}")
-            self.semaphore.release()
-
-    async def _execute_and_resume_task(self, task: Task, tool_calls: list):
-        """Executes tool calls and places the task in the resumption queue."""
-        logger.info(f"Executing {len(tool_calls.get('calls', []))} tool calls for task {task.id}...")
-        tool_results = []
-        for tool_call in tool_calls.get("calls", []):
-            tool_name = tool_call.function.name
-            if tool_name in self._tool_functions:
-                try:
-                    # Arguments are a JSON string, so we need to parse them
-                    args = json.loads(tool_call.function.arguments)
-                    logger.info(f"Calling tool `{tool_name}` with args: {args}")
-                    # In a real-world scenario, you might need to handle async tool functions
-                    result = self._tool_functions[tool_name](**args)
-                    content = json.dumps({"result": result})
-                except Exception as e:
-                    logger.error(f"Error executing tool {tool_name} for task {task.id}: {e}", exc_info=True)
-                    content = json.dumps({"error": str(e)})
-            else:
-                logger.warning(f"Tool `{tool_name}` not found for task {task.id}.")
-                content = json.dumps({"error": f"Tool '{tool_name}' not found."})
 
-            tool_results.append({
-                "tool_call_id": tool_call.id,
-                "role": "tool",
-                "name": tool_name,
-                "content": content,
-            })
+    async def _execute_and_resume_task(self, task: Task, tool_calls: Dict[str, Any], generator: AsyncGenerator):
+        """Executes tool calls and puts the task, with its paused generator, back on the ready queue."""
+        calls = tool_calls.get("calls", [])
+        logger.info(f"Executing {len(calls)} tool calls for task {task.id}...")
+        # The calls are independent, so run them concurrently; gather keeps results in call order,
+        # which the agent relies on to pair each result with its tool call.
+        tool_results = list(await asyncio.gather(*(self._run_one_tool(task, tool_call) for tool_call in calls)))
 
         task.result = tool_results
-        logger.info(f"Tool calls for task {task.id} completed. Adding to resumption queue.")
-        await self.resumption_queue.put((task, tool_results))
+        logger.info(f"Tool calls for task {task.id} completed. Re-queueing task for resumption.")
+        self._enqueue(task, tool_results, generator)
+
+    async def _run_one_tool(self, task: Task, tool_call: Any) -> Dict[str, Any]:
+        """Executes a single tool call and returns it as a tool message for the agent."""
+        function = tool_call.function
+        tool_name = function.name
+        tool_function = self._tool_functions.get(tool_name)
+        if tool_function is not None:
+            try:
+                # Arguments are a JSON string, so we need to parse them
+                args = orjson.loads(function.arguments)
+                logger.info(f"Calling tool `{tool_name}` with args: {args}")
+                if inspect.iscoroutinefunction(tool_function):
+                    result = await tool_function(**args)
+                else:
+                    # Synchronous tools may block (HTTP, disk), so run them on a worker thread.
+                    # Without an executor (scheduler stopped) this falls back to the loop's default one.
+                    loop = asyncio.get_running_loop()
+                    result = await loop.run_in_executor(self._tool_executor, functools.partial(tool_function, **args))
+                content = _dumps_tool_content({"result": result})
+            except Exception as e:
+                logger.error(f"Error executing tool {tool_name} for task {task.id}: {e}", exc_info=True)
+                content = _dumps_tool_content({"error": str(e)})
+        else:
+            logger.warning(f"Tool `{tool_name}` not found for task {task.id}.")
+            content = _dumps_tool_content({"error": f"Tool '{tool_name}' not found."})
+
+        return {
+            "tool_call_id": tool_call.id,
+            "role": "tool",
+            "name": tool_name,
+            "content": content,
+        }
 
     async def _handle_task_completion(self, task: Task):
-        """Handles the logic for when a task finishes, either by completing or failing."""
-        async with self._lock:
-            if task.status == TaskStatus.COMPLETED:
-                self.completed_tasks_count += 1
+        """
+        Handles the logic for when a task finishes, either by completing or failing.
+        Finishing a task can finish its parent, and so on up the tree; that chain is
+        walked in a loop rather than by recursion.
+        """
+        while task is not None:
+            if task.status is TaskStatus.COMPLETED:
                 logger.info(f"--- Task '{task.name}' ({task.id}) COMPLETED ---")
-            elif task.status == TaskStatus.FAILED:
-                self.failed_tasks_count += 1
+            elif task.status is TaskStatus.FAILED:
                 logger.error(f"--- Task '{task.name}' ({task.id}) FAILED: {task.result} ---")
 
-            # Clean up generator for the completed/failed task
-            if task.id in self.task_generators:
-                del self.task_generators[task.id]
-
             # --- Dependency Resolution for other tasks ---
-            # Find all tasks that were waiting for this one to finish
-            dependent_tasks = [t for t in self.tasks.values() if task.id in t.waiting_for_dependencies]
-            for dep_task in dependent_tasks:
-                dep_task.waiting_for_dependencies.remove(task.id)
+            # Only the tasks recorded as waiting for this one need to be revisited.
+            for dependent_id in self._dependents.pop(task.id, ()):
+                dep_task = self.tasks[dependent_id]
+                dep_task.pending_dependencies -= 1
                 logger.info(f"Resolved dependency '{task.name}' for '{dep_task.name}'.")
-                if dep_task.is_ready():
-                    logger.info(f"Task '{dep_task.name}' is now ready. Enqueuing.")
-                    await self.pending_queue.put(dep_task)
+                if not dep_task.pending_dependencies:
+                    logger.info(f"Task '{dep_task.name}' is now ready. Queueing.")
+                    self._enqueue(dep_task)
 
             # --- Parent Task Completion ---
             # If this was a subtask, check if its parent is now finished
+            finished_parent = None
             if task.parent_id and task.parent_id in self.tasks:
                 parent_task = self.tasks[task.parent_id]
-                if task.id in parent_task.waiting_for_subtasks:
-                    parent_task.waiting_for_subtasks.remove(task.id)
-                
+                parent_task.remaining_subtasks -= 1
+                if task.status is TaskStatus.FAILED:
+                    parent_task.any_subtask_failed = True
+
                 # If the parent has no more subtasks to wait for, it's complete
-                if not parent_task.waiting_for_subtasks:
-                    logger.info(f"All subtasks for parent '{parent_task.name}' are complete.")
+                if parent_task.is_complete():
+                    if parent_task.any_subtask_failed:
+                        self._completed_with_failed_subtasks += 1
+                        logger.warning(f"All subtasks for parent '{parent_task.name}' are finished, but at least one failed.")
+                    else:
+                        logger.info(f"All subtasks for parent '{parent_task.name}' are complete.")
                     # The result of the parent is the result of its final subtask.
                     # We assume the last completed subtask holds the final result.
                     parent_task.complete(result=task.result)
-                    # Recursively handle the completion of the parent task
-                    await self._handle_task_completion(parent_task)
+                    # Handle the parent next, which also counts it off against its own parent.
+                    finished_parent = parent_task
 
-                    # Also, if this parent task itself has a parent, remove it from the grandparent's waiting list
-                    if parent_task.parent_id and parent_task.parent_id in self.tasks:
-                        grandparent_task = self.tasks[parent_task.parent_id]
-                        if parent_task.id in grandparent_task.waiting_for_subtasks:
-                            grandparent_task.waiting_for_subtasks.remove(parent_task.id)
+            task = finished_parent
 
     async def get_task_by_id(self, task_id: str) -> Optional[Task]:
         """Retrieves a task by its ID."""
@@ -338,15 +568,14 @@ class Scheduler:
 
     async def get_stats(self) -> Dict[str, Any]:
         """Returns current statistics about the scheduler."""
-        async with self._lock:
-            running_tasks = self.max_concurrent_tasks - self.semaphore._value
-            return {
-                "is_running": self.is_running,
-                "running_tasks": running_tasks,
-                "pending_tasks": self.pending_queue.qsize(),
-                "resumption_queue_size": self.resumption_queue.qsize(),
-                "total_known_tasks": len(self.tasks),
-                "completed_tasks": self.completed_tasks_count,
-                "failed_tasks": self.failed_tasks_count,
-                "max_concurrent_tasks": self.max_concurrent_tasks
-            }
+        return {
+            "is_running": self.is_running,
+            "running_tasks": len(self._busy_workers),
+            "pending_tasks": self._ready_queue.qsize(),
+            "total_known_tasks": len(self.tasks),
+            "completed_tasks": self._status_counts[TaskStatus.COMPLETED],
+            "failed_tasks": self._status_counts[TaskStatus.FAILED],
+            "completed_with_failed_subtasks": self._completed_with_failed_subtasks,
+            "tasks_by_status": {status.value: self._status_counts[status] for status in TaskStatus},
+            "max_concurrent_tasks": self.max_concurrent_tasks
+        }
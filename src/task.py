@@ -1,8 +1,9 @@
 # src/task.py
+import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Callable, Dict, List, Optional, Set
 
 class TaskStatus(Enum):
     QUEUED = "queued"
@@ -18,44 +19,123 @@ class TaskType(Enum):
     FUNCTION_CALL = "function_call"
     INFORMATION_RETRIEVAL = "information_retrieval"
 
+# Task types arrive as strings from plans and API requests, spelled as the enum value
+# or, occasionally, the member name; resolve both with a plain dict lookup instead of Enum.__call__.
+_TASK_TYPE_BY_VALUE: Dict[str, TaskType] = {t.value: t for t in TaskType}
+_TASK_TYPE_BY_VALUE.update({t.name: t for t in TaskType})
+
+def parse_task_type(value: str) -> Optional[TaskType]:
+    """Returns the TaskType named by `value` (case-insensitive), or None if there is none."""
+    # Both canonical spellings are in the table, so only fall back to .lower() on a miss.
+    return _TASK_TYPE_BY_VALUE.get(value) or _TASK_TYPE_BY_VALUE.get(value.lower())
+
 class Task:
-    def __init__(self, name: str, payload: Dict[str, Any], task_type: TaskType, parent_id: Optional[str] = None, dependencies: Optional[List[str]] = None):
-        self.id = str(uuid.uuid4())
+    # The scheduler creates many tasks; slots keep them small and make attribute access cheap.
+    __slots__ = (
+        'id', 'name', 'payload', 'task_type', 'parent_id', 'priority',
+        'dependencies', 'pending_dependencies', 'remaining_subtasks', 'any_subtask_failed',
+        'status', 'on_status_change', 'result', 'created_at', '_created_iso', '_created_ns', '_updated_ns',
+    )
+
+    def __init__(self, name: str, payload: Dict[str, Any], task_type: TaskType, parent_id: Optional[str] = None, dependencies: Optional[List[str]] = None, priority: int = 1, task_id: Optional[str] = None):
+        # Callers creating many tasks at once may pass pre-generated IDs.
+        self.id = task_id or uuid.uuid4().hex
         self.name = name
         self.payload = payload
         self.task_type = task_type
         self.parent_id = parent_id
+        # Lower values are scheduled first.
+        self.priority = priority
         
         # --- Refactored State Management ---
-        # Dependencies that this task is waiting for.
-        self.waiting_for_dependencies: Set[str] = set(dependencies or [])
-        # Subtasks that this task has spawned and is waiting for.
-        self.waiting_for_subtasks: Set[str] = set()
+        # Tasks this task depends on, and how many of them have not finished yet.
+        self.dependencies: Set[str] = set(dependencies or [])
+        self.pending_dependencies: int = len(self.dependencies)
+        # Number of spawned subtasks that have not finished yet.
+        self.remaining_subtasks: int = 0
+        # Set once any of those subtasks fails.
+        self.any_subtask_failed: bool = False
         
         self.status = TaskStatus.QUEUED
+        # Called with (old_status, new_status) on every status change; set by the scheduler.
+        self.on_status_change: Optional[Callable[[TaskStatus, TaskStatus], None]] = None
         self.result: Optional[Any] = None
+        # Wall-clock time is read once; later timestamps are monotonic offsets from it.
         self.created_at = datetime.now()
-        self.updated_at = datetime.now()
+        # created_at never changes, so its ISO form is formatted once, on first serialization.
+        self._created_iso: Optional[str] = None
+        self._created_ns = self._updated_ns = time.monotonic_ns()
 
     def __repr__(self):
         return f"Task(id={self.id}, name='{self.name}', type={self.task_type.name}, status={self.status.name})"
 
+    @property
+    def updated_at(self) -> datetime:
+        """Wall-clock time of the last status change (or of creation)."""
+        return self.created_at + timedelta(microseconds=(self._updated_ns - self._created_ns) // 1000)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns a dict view of the task, as served by the API. The payload is the task's own,
+        which the agent extends with LLM message objects, so encode it with a serializer that
+        understands those (e.g. FastAPI's jsonable_encoder).
+        """
+        if self._created_iso is None:
+            self._created_iso = self.created_at.isoformat()
+        return {
+            "id": self.id,
+            "name": self.name,
+            "task_type": self.task_type.value,
+            "status": self.status.value,
+            "priority": self.priority,
+            "parent_id": self.parent_id,
+            "payload": self.payload,
+            "dependencies": sorted(self.dependencies),
+            # A completed parent's result is its last subtask's, so flag when any subtask failed.
+            "any_subtask_failed": self.any_subtask_failed,
+            "result": self.result,
+            "created_at": self._created_iso,
+            "updated_at": self.updated_at.isoformat(),
+        }
+
+    def add_dependency(self, task_id: str):
+        """Makes this task wait for another task to finish."""
+        if task_id not in self.dependencies:
+            self.dependencies.add(task_id)
+            self.pending_dependencies += 1
+
     def is_ready(self) -> bool:
         """A task is ready to run if it's not waiting on any dependencies."""
-        return not self.waiting_for_dependencies
+        return self.pending_dependencies == 0
 
     def is_complete(self) -> bool:
         """A task is considered fully complete if its subtasks are all done."""
-        return not self.waiting_for_subtasks
+        return self.remaining_subtasks == 0
+
+    def is_finished(self) -> bool:
+        """A task is finished once it has either completed or failed."""
+        return self.status is TaskStatus.COMPLETED or self.status is TaskStatus.FAILED
 
     def update_status(self, status: TaskStatus):
+        old_status = self.status
         self.status = status
-        self.updated_at = datetime.now()
+        self._updated_ns = time.monotonic_ns()
+        if self.on_status_change is not None:
+            self.on_status_change(old_status, status)
 
+    # complete() and fail() run once for every task, so they repeat update_status() inline.
     def complete(self, result: Any):
-        self.update_status(TaskStatus.COMPLETED)
+        old_status = self.status
+        self.status = TaskStatus.COMPLETED
+        self._updated_ns = time.monotonic_ns()
+        if self.on_status_change is not None:
+            self.on_status_change(old_status, TaskStatus.COMPLETED)
         self.result = result
 
     def fail(self, error_message: str):
-        self.update_status(TaskStatus.FAILED)
+        old_status = self.status
+        self.status = TaskStatus.FAILED
+        self._updated_ns = time.monotonic_ns()
+        if self.on_status_change is not None:
+            self.on_status_change(old_status, TaskStatus.FAILED)
         self.result = {"error": error_message}